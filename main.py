@@ -14,82 +14,292 @@ After running, you can do `/ia reload` in-game to apply changes.
 """
 
 import asyncio
+import concurrent.futures
 import json
 import os
+import re
 import sys
 from pathlib import Path
 
+# orjson is an optional speedup for merging sounds/fonts JSON; the stdlib
+# parser is used when it isn't installed.
 try:
-    import aiofiles
-    from rich.console import Console
-    from rich.progress import (
-        Progress,
-        BarColumn,
-        TextColumn,
-        TimeElapsedColumn,
-        TimeRemainingColumn,
-    )
+    import orjson
 except ImportError:
-    import subprocess
+    orjson = None
 
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "rich", "aiofiles", "-q"])
-    import aiofiles
-    from rich.console import Console
-    from rich.progress import (
-        Progress,
-        BarColumn,
-        TextColumn,
-        TimeElapsedColumn,
-        TimeRemainingColumn,
-    )
 
-console = Console()
+class PlainConsole:
+    """Stand-in for rich's Console when output isn't a terminal.
+
+    Prints through `print`, dropping the `[color]...[/color]` markup used in
+    our messages.
+    """
+
+    markup = re.compile(r"\[/?[a-z]+\]")
+
+    def print(self, *objects):
+        print(*(self.markup.sub("", str(o)) for o in objects))
+
+
+def make_console():
+    """Return a Rich console for terminals, a plain one for piped/CI output.
+
+    Rich is only imported (and installed if missing) for interactive runs.
+    """
+    if not sys.stdout.isatty():
+        return PlainConsole()
+    try:
+        from rich.console import Console
+    except ImportError:
+        import subprocess
+
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "rich", "-q"])
+        from rich.console import Console
+    return Console()
+
+
+console = make_console()
+
+# Number of tasks pulling move batches off the queue, which also bounds how
+# many batches can sit in the executor at once.
+MOVE_WORKERS = 32
+# Files renamed per executor job.
+MOVE_BATCH = 64
+# Progress is advanced in steps this size to keep Rich's lock traffic down.
+PROGRESS_STEP = 64
+# Upper bound on config files being rewritten at the same time.
+REPLACE_LIMIT = 32
 
 
-async def async_move(src: Path, dst: Path):
-    """Move a file asynchronously and ensure parent dirs exist safely."""
+async def async_move(pairs: list):
+    """Move a batch of `(src, dst)` files in one executor job.
+
+    Returns one bool per pair, False where the source was already gone.
+    Every destination dir is created up front by main(), so there is no
+    mkdir here.
+    """
     loop = asyncio.get_running_loop()
 
     def do_move():
-        # Skip if source doesn't exist (already moved)
-        if not src.exists():
-            return False
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        src.replace(dst)
-        return True
+        # One dispatch per batch keeps per-file cost down to the rename itself
+        results = []
+        for src, dst in pairs:
+            try:
+                os.replace(src, dst)
+            except FileNotFoundError:
+                # Source is gone (already moved)
+                results.append(False)
+            else:
+                results.append(True)
+        return results
 
     return await loop.run_in_executor(None, do_move)
 
 
-def safe_name(namespace: str, name: str, dest: Path):
-    """Generate unique filename with namespace prefix."""
-    base, ext = os.path.splitext(name)
+def load_json(path: Path):
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def dump_json(obj, path: Path):
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    else:
+        path.write_text(json.dumps(obj, indent=2), encoding="utf-8")
+
+
+def iter_dirs(root):
+    """Yield `(dir_path, files)` for every directory under `root`.
+
+    `files` holds the `DirEntry` of each regular file directly inside
+    `dir_path`. Uses scandir so file/dir checks come from the directory
+    listing instead of a stat per path. Directories that can't be read are
+    skipped, like `Path.rglob` does.
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        path = stack.pop()
+        files = []
+        try:
+            it = os.scandir(path)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                # Don't recurse through directory symlinks, but do pick up
+                # symlinked files, as Path.rglob + is_file() did
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    files.append(entry)
+        yield path, files
+
+
+def iter_files(root):
+    """Yield a `DirEntry` for every regular file under `root`."""
+    for _, files in iter_dirs(root):
+        yield from files
+
+
+def name_key(name: str):
+    """Key a file name the way the destination filesystem compares names.
+
+    Windows and macOS filesystems are case-insensitive by default, so
+    `ns_Sword.png` and `ns_sword.png` are the same file there.
+    """
+    if sys.platform in ("win32", "darwin"):
+        return name.casefold()
+    return name
+
+
+def safe_name(namespace: str, base: str, ext: str, dest: Path, claimed: dict):
+    """Generate unique filename with namespace prefix.
+
+    `base` and `ext` are the original name already split by the scanner.
+    `claimed` maps each destination dir to the `name_key`s already taken in
+    it, seeded from disk once, so picking a name never touches the
+    filesystem. The chosen name is claimed before returning.
+    """
+    taken = claimed[dest]
     new_name = f"{namespace}_{base}{ext}"
     i = 1
-    while (dest / new_name).exists():
+    while name_key(new_name) in taken:
         new_name = f"{namespace}_{base}_{i}{ext}"
         i += 1
+    taken.add(name_key(new_name))
     return new_name
 
 
-async def replace_in_file(file: Path, mapping: dict):
+def _replace_sync(file: str, pattern: re.Pattern, qualified: dict, scope: dict):
     try:
-        async with aiofiles.open(file, "r", encoding="utf-8") as f:
-            content = await f.read()
+        with open(file, "rb") as f:
+            data = f.read()
     except Exception:
         return False
-    new_content = content
-    for old, new in mapping.items():
-        if old in new_content:
-            new_content = new_content.replace(old, new)
-    if new_content != content:
-        async with aiofiles.open(file, "w", encoding="utf-8") as f:
-            await f.write(new_content)
-        return True
-    return False
+    count = 0
+
+    def repl(m):
+        nonlocal count
+        token = m.group(0)
+        new = qualified.get(token) or scope.get(token)
+        if new is None and b":" in token:
+            # `ns:name` we didn't move as a pair; the bare name may still map
+            prefix, _, name = token.partition(b":")
+            new = scope.get(name)
+            if new is not None:
+                new = prefix + b":" + new
+        if new is None:
+            return token
+        count += 1
+        return new
+
+    new_data = pattern.sub(repl, data)
+    if count:
+        with open(file, "wb") as f:
+            f.write(new_data)
+    return count > 0
+
+
+async def replace_in_file(
+    file: str, pattern: re.Pattern, qualified: dict, scope: dict, limit: asyncio.Semaphore
+):
+    """Rewrite the names `pattern` finds in a file, in one worker thread.
+
+    `ns:name` matches resolve through `qualified`, bare names through the
+    file's `scope`; anything else is left as is. `limit` caps how many
+    rewrites are in flight at once.
+    """
+    async with limit:
+        return await asyncio.to_thread(_replace_sync, file, pattern, qualified, scope)
+
+
+# A file name, optionally `ns:`-qualified. Matching whole tokens and looking
+# them up in a dict keeps a rewrite linear in the file size no matter how
+# many keys there are.
+NAME_TOKEN = rb"(?:[\w.-]+:)?[\w.-]+"
+
+
+def build_pattern(keys):
+    """Compile a matcher for every key in `keys`.
+
+    Ordinary names are caught by NAME_TOKEN. Keys it can't match (spaces,
+    brackets, ...) are rare and get their own alternatives, longest first,
+    tried before the token.
+    """
+    token = re.compile(NAME_TOKEN)
+    odd = sorted((k for k in keys if not token.fullmatch(k)), key=len, reverse=True)
+    return re.compile(b"|".join([*(re.escape(k) for k in odd), NAME_TOKEN]))
+
+
+class NullProgress:
+    """Stand-in for rich's Progress when output isn't a terminal."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_task(self, *args, **kwargs):
+        return 0
+
+    def advance(self, *args, **kwargs):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+def make_progress():
+    """Return a Rich progress display, or a no-op one for piped/CI output."""
+    if not sys.stdout.isatty():
+        return NullProgress()
+    from rich.progress import (
+        Progress,
+        BarColumn,
+        TextColumn,
+        TimeElapsedColumn,
+        TimeRemainingColumn,
+    )
+
+    return Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        TimeRemainingColumn(),
+        TimeElapsedColumn(),
+        console=console,
+    )
+
+
+def event_loop_factory():
+    """Return uvloop's loop factory (winloop's on Windows) if it's installed.
+
+    Both are optional; asyncio's default loop is used otherwise.
+    """
+    try:
+        if sys.platform == "win32":
+            import winloop as loop_impl
+        else:
+            import uvloop as loop_impl
+    except ImportError:
+        return None
+    return loop_impl.new_event_loop
 
 
 async def main():
+    # All moves and rewrites go through the default executor. Size it for a
+    # syscall-bound workload rather than asyncio's min(32, cpu + 4).
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(32, (os.cpu_count() or 4) * 2),
+            thread_name_prefix="pack-io",
+        )
+    )
+
     base_dir = Path.cwd()
     ia_dir = base_dir / "plugins" / "ItemsAdder"
     if not ia_dir.exists():
@@ -109,140 +319,251 @@ async def main():
 
     for d in [models_dst, textures_dst, sounds_dst, configs_dst]:
         d.mkdir(parents=True, exist_ok=True)
+    claimed = {
+        d: {name_key(name) for name in os.listdir(d)}
+        for d in [models_dst, textures_dst, sounds_dst, configs_dst]
+    }
+
+    # contents/resourcepack is where everything is flattened to; it must never
+    # be scanned as a namespace, since moves land in it while the walk runs.
+    output_root = contents / "resourcepack"
 
     namespaces = []
     if contents.exists():
-        # Add top-level namespace directories
-        namespaces += [p for p in contents.iterdir() if p.is_dir() and not p.name.startswith("_")]
-        # Also scan for nested resourcepack/assets directories within namespaces
-        for ns_dir in contents.iterdir():
-            if ns_dir.is_dir() and not ns_dir.name.startswith("_"):
-                nested_assets = ns_dir / "resourcepack" / "assets"
-                if nested_assets.exists():
-                    namespaces += [p for p in nested_assets.iterdir() if p.is_dir()]
+        ns_dirs = [
+            p
+            for p in contents.iterdir()
+            if p.is_dir() and not p.name.startswith("_") and p != output_root
+        ]
+        # Nested resourcepack/assets/<ns> dirs are walked as part of these
+        namespaces += ns_dirs
     if rp_assets.exists():
         namespaces += [p for p in rp_assets.iterdir() if p.is_dir()]
 
+    # Drop roots that resolve to the same place or sit inside another root,
+    # so no file is walked twice.
+    resolved = {}
+    for ns in namespaces:
+        resolved.setdefault(ns.resolve(), ns)
+    namespaces = [
+        ns
+        for r, ns in resolved.items()
+        if not any(r != other and r.is_relative_to(other) for other in resolved)
+    ]
+
+    # `ns:name` references are unambiguous and apply to every config. Bare
+    # names are kept per namespace, since two namespaces can both move a
+    # file with the same name.
     moved = {}
+    local_names = {}
+    origin = {}
     special = {"sounds.json": [], "fonts.json": []}
 
-    all_files = []
-    for ns in namespaces:
-        for p in ns.rglob("*"):
-            if not p.is_file():
-                continue
-            if p.name in special:
-                special[p.name].append(p)
-                continue
-            all_files.append((ns.name, p))
-
+    roots = [(ns, ns.name, False) for ns in namespaces]
     if items_packs.exists():
-        for p in items_packs.rglob("*"):
-            if p.is_file():
-                all_files.append(("items_packs", p))
+        roots.append((items_packs, "items_packs", True))
 
-    with Progress(
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        TimeRemainingColumn(),
-        TimeElapsedColumn(),
-        console=console,
-    ) as progress:
-        task = progress.add_task("Flattening...", total=len(all_files))
-        for ns, p in all_files:
-            ext = p.suffix.lower()
-            if ext == ".png":
-                dest = textures_dst
-            elif ext == ".mcmeta":
-                # Move .mcmeta files alongside their textures/models/sounds
-                # Check if it's next to a PNG (texture), OGG (sound), or JSON (model)
-                parent_path = str(p.parent).lower()
-                if "textures" in parent_path or p.with_suffix(".png").exists():
-                    dest = textures_dst
-                elif "sounds" in parent_path or p.with_suffix(".ogg").exists():
-                    dest = sounds_dst
-                elif "models" in parent_path:
-                    dest = models_dst
-                else:
-                    # Default to textures if unclear
-                    dest = textures_dst
-            elif ext in {".yml", ".yaml"} and "items_packs" in str(p):
-                dest = configs_dst
-            elif ext == ".json" and "items_packs" in str(p):
-                dest = configs_dst
-            elif ext == ".json" and "models" in str(p).lower():
-                dest = models_dst
-            elif ext == ".ogg":
-                dest = sounds_dst
-            else:
-                progress.update(task, advance=1)
-                continue
+    # Suffixes whose destination doesn't depend on where the file lives
+    ext_dest = {".png": textures_dst, ".ogg": sounds_dst}
 
-            new_name = safe_name(ns, p.name, dest)
-            new_path = dest / new_name
-            moved_ok = await async_move(p, new_path)
-            if moved_ok:
-                rel = f"{ns}:{p.name}"
-                moved[rel] = new_name
-                moved[p.name] = new_name
-            progress.update(task, advance=1)
-
-    # merge sounds.json
-    if special["sounds.json"]:
-        merged = {}
-        for path in special["sounds.json"]:
-            try:
-                data = json.loads(path.read_text(encoding="utf-8"))
-                merged.update(data)
-            except Exception:
-                pass
-        out = sounds_dst / "sounds.json"
-        out.write_text(json.dumps(merged, indent=2), encoding="utf-8")
-        console.print(f"Merged sounds.json -> {out}")
-
-    # merge fonts.json
-    if special["fonts.json"]:
-        merged = {"providers": []}
-        for path in special["fonts.json"]:
+    def scan(root, from_items_packs):
+        """Yield `(by_dest, specials)` for one directory at a time.
+
+        Driven from a worker thread. Files come back bucketed by destination,
+        and a whole directory is classified before any of it moves, so the
+        .mcmeta sibling checks still see their textures/sounds.
+        """
+        for parent, files in iter_dirs(root):
+            if not files:
+                continue
+            parent_lower = parent.lower()
+            by_dest = {d: [] for d in [textures_dst, models_dst, sounds_dst, configs_dst]}
+            specials = []
+            for entry in files:
+                if not from_items_packs and entry.name in special:
+                    specials.append(entry)
+                    continue
+                # Split each name once; the pieces feed both classification
+                # and safe_name.
+                base, ext = os.path.splitext(entry.name)
+                ext_lower = ext.lower()
+                dest = ext_dest.get(ext_lower)
+                if dest is None:
+                    if ext_lower == ".mcmeta":
+                        # Move .mcmeta files alongside their textures/models/sounds
+                        # Check if it's next to a PNG (texture), OGG (sound), or JSON (model)
+                        stem = os.path.join(parent, base)
+                        if "textures" in parent_lower or os.path.exists(stem + ".png"):
+                            dest = textures_dst
+                        elif "sounds" in parent_lower or os.path.exists(stem + ".ogg"):
+                            dest = sounds_dst
+                        elif "models" in parent_lower:
+                            dest = models_dst
+                        else:
+                            # Default to textures if unclear
+                            dest = textures_dst
+                    elif from_items_packs and ext_lower in {".yml", ".yaml", ".json"}:
+                        dest = configs_dst
+                    elif ext_lower == ".json" and "models" in parent_lower:
+                        dest = models_dst
+                    else:
+                        continue
+                by_dest[dest].append((entry.name, base, ext, entry.path))
+            yield by_dest, specials
+
+    # The walk and the renames overlap: the producer pulls one directory at a
+    # time from the scanner off the loop and queues its moves while workers
+    # drain the queue, so no full file list is ever built.
+    queue = asyncio.Queue(maxsize=MOVE_WORKERS * 2)
+    # Bounds the config rewrites later on, the way the worker count bounds moves
+    replace_limit = asyncio.Semaphore(REPLACE_LIMIT)
+    queued = 0
+    scan_errors = []
+
+    async def produce():
+        nonlocal queued
+        for root, ns, from_items_packs in roots:
+            chunks = scan(root, from_items_packs)
+            # Pending moves per destination, kept across directories so every
+            # batch renames into a single directory.
+            pending = {}
             try:
-                data = json.loads(path.read_text(encoding="utf-8"))
-                if "providers" in data:
-                    merged["providers"].extend(data["providers"])
-            except Exception:
-                pass
-        out = models_dst.parent.parent / "fonts.json"
-        out.write_text(json.dumps(merged, indent=2), encoding="utf-8")
-        console.print(f"Merged fonts.json -> {out}")
-
-    # update config references
-    updated = 0
-    cfg_files = []
-    for d in [configs_dst, models_dst, textures_dst, sounds_dst]:
-        for p in d.rglob("*"):
-            if p.suffix.lower() in {".json", ".yml", ".yaml", ".mcmeta", ".txt"}:
-                cfg_files.append(p)
-
-    with Progress(
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        TimeRemainingColumn(),
-        TimeElapsedColumn(),
-        console=console,
-    ) as progress:
-        task = progress.add_task("Updating configs...", total=len(cfg_files))
-        for f in cfg_files:
-            if await replace_in_file(f, moved):
+                while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                    by_dest, specials = chunk
+                    for entry in specials:
+                        special[entry.name].append(Path(entry.path))
+                    queued += sum(len(files) for files in by_dest.values())
+                    progress.update(flatten_task, total=queued)
+                    for dest, files in by_dest.items():
+                        batch = pending.setdefault(dest, [])
+                        for name, base, ext, src in files:
+                            # Names are claimed here, in queue order, so workers
+                            # never race on the same destination.
+                            new_name = safe_name(ns, base, ext, dest, claimed)
+                            batch.append((ns, name, src, os.path.join(dest, new_name), new_name))
+                            if len(batch) == MOVE_BATCH:
+                                await queue.put(batch)
+                                batch = pending[dest] = []
+            except OSError as e:
+                # Moves from this and earlier trees are already under way, so
+                # stop scanning this tree instead of aborting the whole run
+                # with a half-flattened pack.
+                scan_errors.append(e)
+                console.print(f"[yellow]Warning:[/yellow] stopped scanning {root}: {e}")
+            for batch in pending.values():
+                if batch:
+                    await queue.put(batch)
+        for _ in range(MOVE_WORKERS):
+            await queue.put(None)
+
+    async def move_worker():
+        while (batch := await queue.get()) is not None:
+            results = await async_move([(src, new_path) for _, _, src, new_path, _ in batch])
+            for (ns, name, _, new_path, new_name), moved_ok in zip(batch, results):
+                if moved_ok:
+                    moved[f"{ns}:{name}"] = new_name
+                    local_names.setdefault(ns, {})[name] = new_name
+                    if ns != "items_packs":
+                        origin[new_path] = ns
+            progress.advance(flatten_task, len(batch))
+
+    with make_progress() as progress:
+        flatten_task = progress.add_task("Flattening...", total=None)
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(MOVE_WORKERS):
+                tg.create_task(move_worker())
+            tg.create_task(produce())
+
+        # merge sounds.json
+        if special["sounds.json"]:
+            merged = {}
+            for path in special["sounds.json"]:
+                try:
+                    data = load_json(path)
+                    merged.update(data)
+                except Exception:
+                    pass
+            out = sounds_dst / "sounds.json"
+            dump_json(merged, out)
+            console.print(f"Merged sounds.json -> {out}")
+
+        # merge fonts.json
+        if special["fonts.json"]:
+            merged = {"providers": []}
+            for path in special["fonts.json"]:
+                try:
+                    data = load_json(path)
+                    if "providers" in data:
+                        merged["providers"].extend(data["providers"])
+                except Exception:
+                    pass
+            out = models_dst.parent.parent / "fonts.json"
+            dump_json(merged, out)
+            console.print(f"Merged fonts.json -> {out}")
+
+        # update config references
+        # Files that came from an asset namespace resolve bare names within that
+        # namespace. Everything else (items_packs configs, files that were
+        # already in place) only gets bare names no other namespace also moved.
+        owners = {}
+        for ns, names in local_names.items():
+            for name in names:
+                owners.setdefault(name, []).append(ns)
+        unique_names = {
+            name: local_names[found[0]][name] for name, found in owners.items() if len(found) == 1
+        }
+
+        def encode(mapping):
+            # Replacements are plain path fragments, so match on raw bytes and
+            # skip decoding every file.
+            return {k.encode("utf-8"): v.encode("utf-8") for k, v in mapping.items()}
+
+        # One matcher for every key; which bare names apply is decided per
+        # file when a match is looked up.
+        qualified = encode(moved)
+        scopes = {ns: encode(names) for ns, names in local_names.items()}
+        unique_scope = encode(unique_names)
+        pattern = build_pattern(
+            qualified.keys() | {name for names in scopes.values() for name in names}
+        )
+
+        updated = 0
+        cfg_files = []
+        # Nothing can need rewriting unless something moved
+        if moved:
+            for d in [configs_dst, models_dst, textures_dst, sounds_dst]:
+                for entry in iter_files(d):
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    if ext in {".json", ".yml", ".yaml", ".mcmeta", ".txt"}:
+                        cfg_files.append(entry.path)
+
+        update_task = progress.add_task("Updating configs...", total=len(cfg_files))
+        jobs = [
+            replace_in_file(
+                f, pattern, qualified, scopes.get(origin.get(f), unique_scope), replace_limit
+            )
+            for f in cfg_files
+        ]
+        done = 0
+        for job in asyncio.as_completed(jobs):
+            if await job:
                 updated += 1
-            progress.update(task, advance=1)
+            done += 1
+            if done % PROGRESS_STEP == 0:
+                progress.advance(update_task, PROGRESS_STEP)
+        progress.advance(update_task, done % PROGRESS_STEP)
 
     console.print(f"\n[green]Done![/green] Updated {updated} config files.")
+    if scan_errors:
+        console.print(
+            f"[yellow]{len(scan_errors)} namespace folder(s) could not be fully"
+            " scanned; files not reached were left in place.[/yellow]"
+        )
     console.print("[cyan]Done.[/cyan]")
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main(), loop_factory=event_loop_factory())
     except KeyboardInterrupt:
         console.print("[red]Cancelled by user.[/red]")